@@ -11,6 +11,10 @@ import os
 import numpy as np
 import requests
 import hashlib
+from collections import Counter
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +23,10 @@ logger = logging.getLogger(__name__)
 # Initialize global variables for data storage
 app.last_upload_data = {}
 app.session_datasets = {}  # Use this to store multiple datasets by file_id
+app.dataset_profiles = {}  # Cached (uploaded_at, profile) pairs by file_id
+app.session_frames = {}  # Dtype-optimized DataFrames by file_id (upcast before doing arithmetic)
+app.memory_reports = {}  # Per-column memory usage reports by file_id
+history_lock = threading.Lock()  # Guards writes to app.history_items
 
 # OpenAI API configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
@@ -53,6 +61,118 @@ def index():
 def test():
     return jsonify({'message': 'Connection successful', 'timestamp': datetime.now().isoformat()})
 
+def clean_value(item):
+    """Convert a DataFrame value to a JSON-serializable Python value."""
+    if isinstance(item, np.bool_):
+        return bool(item)
+    if isinstance(item, np.integer):
+        return int(item)
+    if isinstance(item, np.floating):
+        return None if np.isnan(item) else float(item)
+    if pd.isna(item):
+        return None
+    return item
+
+def frame_to_records(df: pd.DataFrame) -> list:
+    """Convert a DataFrame to a list of row dicts with JSON-serializable values."""
+    columns = df.columns.tolist()
+    return [
+        {col: clean_value(value) for col, value in zip(columns, row)}
+        for row in df.astype(object).itertuples(index=False, name=None)
+    ]
+
+# Dtype optimization configuration
+CATEGORY_MAX_UNIQUE_RATIO = 0.5  # Encode string columns as categoricals below this unique/non-null ratio
+
+# Candidate integer types from smallest to largest, as (numpy type, nullable pandas type).
+# Only signed types are used, which avoids unsigned wrap-around on subtraction (uint8(0) - 1 == 255).
+# Arithmetic can still overflow the downcast type (int8(100) + 100 == -56), so stored frames in
+# session_frames must be upcast (e.g. astype('int64') / 'Int64') before computing on them.
+INTEGER_TYPES = [(np.int8, 'Int8'), (np.int16, 'Int16'), (np.int32, 'Int32'), (np.int64, 'Int64')]
+
+def smallest_integer_dtype(min_value, max_value, nullable: bool = False):
+    """Return the smallest integer dtype that can hold values between min_value and max_value."""
+    for numpy_type, nullable_type in INTEGER_TYPES:
+        info = np.iinfo(numpy_type)
+        if info.min <= min_value and max_value <= info.max:
+            return nullable_type if nullable else numpy_type
+    return None
+
+def optimize_series(series: pd.Series) -> pd.Series:
+    """
+    Convert a column to a more compact dtype without losing information:
+    - integers are downcast to the smallest fitting signed integer type
+    - integral floats with missing values become nullable integers
+    - floats are downcast to float32 when every value round-trips exactly
+    - boolean object columns become the nullable boolean type
+    - repeated strings are dictionary-encoded as categoricals
+    """
+    non_null = series.dropna()
+    if non_null.empty or pd.api.types.is_bool_dtype(series):
+        return series
+    
+    if pd.api.types.is_integer_dtype(series):
+        dtype = smallest_integer_dtype(non_null.min(), non_null.max(), nullable=series.hasnans)
+        return series.astype(dtype) if dtype is not None else series
+    
+    if pd.api.types.is_float_dtype(series):
+        if series.hasnans and np.isfinite(non_null).all() and (non_null % 1 == 0).all():
+            dtype = smallest_integer_dtype(non_null.min(), non_null.max(), nullable=True)
+            if dtype is not None:
+                return series.astype(dtype)
+        downcast = series.astype(np.float32)
+        if np.array_equal(downcast.to_numpy(dtype=np.float64), series.to_numpy(dtype=np.float64), equal_nan=True):
+            return downcast
+        return series
+    
+    if series.dtype == object:
+        inferred = pd.api.types.infer_dtype(non_null, skipna=True)
+        if inferred == 'boolean':
+            return series.astype('boolean')
+        if inferred == 'string' and non_null.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(non_null):
+            return series.astype('category')
+    
+    return series
+
+def optimize_dataframe_dtypes(df: pd.DataFrame) -> tuple:
+    """
+    Optimize the dtypes of every column in a DataFrame to reduce its memory footprint.
+    Returns a (DataFrame, report) tuple where the report lists the dtype and
+    deep memory usage of each column before and after optimization.
+    """
+    columns = []
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        bytes_before = int(series.memory_usage(index=False, deep=True))
+        optimized = optimize_series(series)
+        bytes_after = int(optimized.memory_usage(index=False, deep=True))
+        
+        # Only keep the conversion if it actually saves memory
+        if bytes_after < bytes_before:
+            df.isetitem(position, optimized)
+        else:
+            optimized = series
+            bytes_after = bytes_before
+        
+        columns.append({
+            'name': str(df.columns[position]),
+            'dtypeBefore': str(series.dtype),
+            'dtypeAfter': str(optimized.dtype),
+            'bytesBefore': bytes_before,
+            'bytesAfter': bytes_after
+        })
+    
+    total_before = sum(col['bytesBefore'] for col in columns)
+    total_after = sum(col['bytesAfter'] for col in columns)
+    report = {
+        'rows': len(df),
+        'columns': columns,
+        'totalBytesBefore': total_before,
+        'totalBytesAfter': total_after,
+        'reductionPercent': round(100 * (total_before - total_after) / total_before, 2) if total_before else 0.0
+    }
+    return df, report
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """
@@ -117,41 +237,52 @@ def upload_file():
         column_headers = df.columns.tolist()
         logger.info(f"Parsed {len(df)} rows and {len(column_headers)} columns")
             
-        # Clean data for JSON serialization
-        def clean_nan(item):
-            if isinstance(item, (np.int64, np.int32, np.int16, np.int8)):
-                return int(item)
-            if isinstance(item, (np.float64, np.float32, np.float16)):
-                return None if np.isnan(item) else float(item)
-            if pd.isna(item):
-                return None
-            return item
-                
-        # Convert DataFrame to dict for JSON serialization
-        parsed_data = []
-        for _, row in df.iterrows():
-            row_data = {col: clean_nan(row[col]) for col in df.columns}
-            parsed_data.append(row_data)
-        
         # Generate a unique file ID if not provided
         file_id = request.form.get('fileId', f"file_{datetime.now().strftime('%Y%m%d%H%M%S')}_{abs(hash(file.filename)) % 10000}")
         
-        # Store the upload data for later analysis
-        result = {
-            'message': 'File uploaded successfully',
+        # Metadata stored for later analysis; the rows themselves live in the optimized DataFrame
+        dataset_info = {
             'filename': file.filename,
             'fileId': file_id,
             'columnHeaders': column_headers,
-            'parsedData': parsed_data,
+            'rowCount': len(df),
             'uploaded_at': datetime.now().isoformat()
         }
         
+        # Convert DataFrame to dict for the JSON response only
+        result = {
+            'message': 'File uploaded successfully',
+            **dataset_info,
+            'parsedData': frame_to_records(df)
+        }
+        
+        # Shrink the stored DataFrame by optimizing column dtypes
+        try:
+            df, memory_report = optimize_dataframe_dtypes(df)
+            memory_report.update({'fileId': file_id, 'filename': file.filename})
+            logger.info(f"Optimized dtypes for {file.filename}: {memory_report['totalBytesBefore']} -> {memory_report['totalBytesAfter']} bytes")
+        except Exception as e:
+            logger.warning(f"Error optimizing dtypes for {file.filename}: {str(e)}")
+            memory_report = None
+        
         # Store this data globally for the session using the file_id as key
         if not hasattr(app, 'session_datasets'):
             app.session_datasets = {}
+        if not hasattr(app, 'session_frames'):
+            app.session_frames = {}
+        if not hasattr(app, 'memory_reports'):
+            app.memory_reports = {}
         
-        app.session_datasets[file_id] = result
-        app.last_upload_data = result  # Keep this for backward compatibility
+        app.session_frames[file_id] = df
+        if memory_report:
+            app.memory_reports[file_id] = memory_report
+        else:
+            app.memory_reports.pop(file_id, None)
+        
+        app.session_datasets[file_id] = dataset_info
+        if hasattr(app, 'dataset_profiles'):
+            app.dataset_profiles.pop(file_id, None)  # Invalidate any stale profile for this ID
+        app.last_upload_data = dataset_info  # Keep this for backward compatibility
         
         logger.info(f"Stored upload data for file: {file.filename} with ID: {file_id}")
                 
@@ -164,8 +295,12 @@ def upload_file():
             'error': f'Error processing file: {str(e)}'
         }), 500
 
-def generate_openai_response(prompt: str, data_description: str = None, dataset_content: str = "") -> str:
-    """Generate a response using OpenAI API."""
+def generate_openai_response(prompt: str, data_description: str = None, dataset_content: str = "", raise_errors: bool = False) -> str:
+    """
+    Generate a response using OpenAI API.
+    API errors are returned as a user-facing message unless raise_errors is set,
+    in which case they are raised to the caller.
+    """
     try:
         logger.info(f"Sending prompt to OpenAI: {prompt}")
         
@@ -257,12 +392,16 @@ def generate_openai_response(prompt: str, data_description: str = None, dataset_
                 return message.strip()
             else:
                 logger.error(f"Unexpected response format: {response_data}")
+                if raise_errors:
+                    raise Exception("Unexpected response format from OpenAI API")
                 return "I encountered an issue while analyzing your data. Please try again with a more specific question."
         else:
             logger.error(f"OpenAI API error: {response.status_code}, {response.text}")
             error_data = response.json() if response.text else {"error": "Unknown error"}
             error_message = error_data.get("error", {}).get("message", f"API returned status code {response.status_code}")
             
+            if raise_errors:
+                raise Exception(f"API error ({response.status_code}): {error_message}")
             if "exceeded your current quota" in str(error_message).lower():
                 return "The API key has exceeded its quota. Please try again later or contact support for assistance."
             elif "invalid api key" in str(error_message).lower():
@@ -272,12 +411,18 @@ def generate_openai_response(prompt: str, data_description: str = None, dataset_
     
     except requests.exceptions.Timeout:
         logger.exception("Timeout error calling OpenAI API")
+        if raise_errors:
+            raise
         return "The request to the AI service timed out. Please try again later."
     except requests.exceptions.RequestException as e:
         logger.exception(f"Network error calling OpenAI API: {str(e)}")
+        if raise_errors:
+            raise
         return f"Network error: {str(e)}"
     except Exception as e:
         logger.exception(f"Error calling OpenAI API: {str(e)}")
+        if raise_errors:
+            raise
         return f"Error: {str(e)}"
 
 # Keep the mock response function as a fallback
@@ -303,6 +448,407 @@ def generate_mock_response(prompt: str) -> str:
     else:
         return "I analyzed the dataset and found it contains various numerical and categorical data. To get more specific insights, try asking about summaries, correlations, distributions, or outliers."
 
+# Dataset context configuration
+MAX_SAMPLE_ROWS = 20          # Sample rows considered per dataset
+TYPE_DETECTION_ROWS = 100     # Rows inspected for type detection and statistics
+MAX_CONTEXT_TOKENS = 3000     # Token budget for the dataset information sent to the model
+CHARS_PER_TOKEN = 4           # Rough character-to-token ratio used for budgeting
+CONTEXT_BUILD_WORKERS = 4     # Thread pool size for building per-dataset profiles
+MAX_DATASETS_PER_REQUEST = 10 # Maximum number of fileIds accepted in one analysis request
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def format_sample_value(value) -> str:
+    """Format a single cell value for the tabular data sample."""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        # Format numbers consistently
+        if isinstance(value, int):
+            return str(value)
+        return f"{value:.4f}".rstrip('0').rstrip('.') if '.' in f"{value:.4f}" else str(value)
+    # For strings, ensure proper representation
+    value_str = str(value)
+    # Truncate very long strings
+    if len(value_str) > 50:
+        value_str = value_str[:47] + "..."
+    return value_str
+
+def format_column_summary(col: str, dtype: str, stats: dict = None) -> str:
+    """Format a column type line, including numerical statistics when available."""
+    line = f"- {col}: {dtype}"
+    if stats:
+        line += f" (min: {stats['min']}, max: {stats['max']}, avg: {stats['avg']:.2f}, count: {stats['count']})"
+    return line + "\n"
+
+def build_dataset_profile(file_id: str, dataset_info: dict) -> dict:
+    """
+    Build the profile of a single dataset from its stored DataFrame:
+    column types, basic statistics for numerical columns and formatted
+    sample rows.
+    """
+    column_headers = dataset_info.get('columnHeaders', [])
+    filename = dataset_info.get('filename', 'unknown file')
+    df = getattr(app, 'session_frames', {}).get(file_id)
+    if df is None:
+        logger.warning(f"No stored data found for file ID {file_id}")
+        df = pd.DataFrame(columns=column_headers)
+    
+    # Only the rows needed for type detection and the sample are converted
+    parsed_data = frame_to_records(df.head(max(TYPE_DETECTION_ROWS, MAX_SAMPLE_ROWS)))
+    
+    logger.info(f"Building profile for file: {filename}, File ID: {file_id}, Rows: {len(df)}, Columns: {len(column_headers)}")
+    
+    data_types = {}
+    numerical_summaries = {}
+    
+    # Detect data types and calculate basic statistics for numerical columns
+    for col in column_headers:
+        # Collect non-null values for this column
+        col_values = [
+            row[col] for row in parsed_data[:TYPE_DETECTION_ROWS]
+            if col in row and row[col] is not None
+        ]
+        
+        if not col_values:
+            data_types[col] = "unknown"
+            continue
+        
+        # Detect type based on first non-null value
+        first_val = col_values[0]
+        if isinstance(first_val, bool):
+            data_types[col] = "boolean"
+        elif isinstance(first_val, (int, float)):
+            data_types[col] = "integer" if isinstance(first_val, int) else "float"
+            valid_nums = [v for v in col_values if isinstance(v, (int, float)) and not isinstance(v, bool) and not pd.isna(v)]
+            if valid_nums:
+                try:
+                    numerical_summaries[col] = {
+                        "min": min(valid_nums),
+                        "max": max(valid_nums),
+                        "avg": sum(valid_nums) / len(valid_nums),
+                        "count": len(valid_nums)
+                    }
+                except Exception as e:
+                    logger.warning(f"Error calculating statistics for column {col}: {str(e)}")
+        else:
+            data_types[col] = "string/categorical"
+    
+    # Format sample rows with proper value representation
+    sample_rows = [
+        " | ".join(format_sample_value(row.get(col)) for col in column_headers)
+        for row in parsed_data[:MAX_SAMPLE_ROWS]
+    ]
+    
+    return {
+        'fileId': file_id,
+        'filename': filename,
+        'columnHeaders': column_headers,
+        'rowCount': len(df),
+        'dataTypes': data_types,
+        'numericalSummaries': numerical_summaries,
+        'sampleRows': sample_rows
+    }
+
+def get_dataset_profile(file_id: str, dataset_info: dict) -> dict:
+    """
+    Return the cached profile for a dataset, building it if necessary.
+    Cache entries are tied to the upload time, so a profile built from a
+    previous upload of the same file ID is never served.
+    """
+    if not hasattr(app, 'dataset_profiles'):
+        app.dataset_profiles = {}
+    
+    uploaded_at = dataset_info.get('uploaded_at')
+    cached = app.dataset_profiles.get(file_id) if file_id else None
+    if cached and cached[0] == uploaded_at:
+        return cached[1]
+    
+    profile = build_dataset_profile(file_id, dataset_info)
+    if file_id:
+        app.dataset_profiles[file_id] = (uploaded_at, profile)
+    return profile
+
+def build_dataset_profiles(datasets: list) -> list:
+    """
+    Build profiles for a list of (file_id, dataset_info) pairs.
+    Multiple datasets are profiled in parallel on a thread pool; the
+    returned profiles keep the order of the input list.
+    """
+    if len(datasets) <= 1:
+        return [get_dataset_profile(file_id, info) for file_id, info in datasets]
+    
+    with ThreadPoolExecutor(max_workers=min(CONTEXT_BUILD_WORKERS, len(datasets))) as executor:
+        return list(executor.map(lambda item: get_dataset_profile(*item), datasets))
+
+def format_sample_block(title: str, profile: dict, budget: int) -> str:
+    """
+    Format the tabular data sample of a dataset, adding rows until the
+    token budget is used up. Returns an empty string if no row fits.
+    """
+    header_row = " | ".join(profile['columnHeaders'])
+    block = f"{title}\n{header_row}\n" + "-" * len(header_row) + "\n"
+    
+    included = 0
+    for row in profile['sampleRows']:
+        if estimate_tokens(block + row + "\n") > budget:
+            break
+        block += row + "\n"
+        included += 1
+    
+    if included < len(profile['sampleRows']):
+        logger.info(f"Context budget reached for {profile['filename']}: {included} of {len(profile['sampleRows'])} sample rows included")
+    return block if included else ""
+
+def group_by_schema(profiles: list) -> list:
+    """
+    Group profiles by column names, keeping the order in which schemas first appear.
+    Returns a list of (columns, profiles) pairs.
+    """
+    schemas = {}
+    for profile in profiles:
+        schemas.setdefault(tuple(profile['columnHeaders']), []).append(profile)
+    return list(schemas.items())
+
+def shared_column_types(columns: tuple, schema_profiles: list) -> dict:
+    """Return the most common detected type of each column, ignoring "unknown" where possible."""
+    shared_types = {}
+    for col in columns:
+        types = [profile['dataTypes'].get(col, "unknown") for profile in schema_profiles]
+        known = [dtype for dtype in types if dtype != "unknown"] or types
+        shared_types[col] = Counter(known).most_common(1)[0][0]
+    return shared_types
+
+def describe_datasets(profiles: list, include_summaries: bool = True) -> str:
+    """
+    Describe several datasets, writing each distinct schema only once
+    followed by the row count and numerical summaries of every file.
+    Files whose detected column types differ from the shared schema list
+    those differences under it.
+    """
+    schemas = group_by_schema(profiles)
+    schema_labels = {}
+    data_description = f"Number of datasets: {len(profiles)}\n"
+    data_description += f"Distinct schemas: {len(schemas)}\n\n"
+    
+    for index, (columns, schema_profiles) in enumerate(schemas, start=1):
+        label = f"Schema {index}"
+        schema_labels[columns] = label
+        shared_types = shared_column_types(columns, schema_profiles)
+        data_description += f"{label} (used by: {', '.join(p['filename'] for p in schema_profiles)})\n"
+        data_description += f"Columns: {', '.join(columns)}\n"
+        data_description += "Column Data Types:\n"
+        for col, dtype in shared_types.items():
+            data_description += format_column_summary(col, dtype)
+        for profile in schema_profiles:
+            differences = [
+                f"{col} ({profile['dataTypes'].get(col, 'unknown')})" for col in columns
+                if profile['dataTypes'].get(col, "unknown") != shared_types[col]
+            ]
+            if differences:
+                data_description += f"Type differences in {profile['filename']}: {', '.join(differences)}\n"
+        data_description += "\n"
+    
+    for profile in profiles:
+        data_description += f"File: {profile['filename']} ({schema_labels[tuple(profile['columnHeaders'])]})\n"
+        data_description += f"Number of rows: {profile['rowCount']}\n"
+        if include_summaries and profile['numericalSummaries']:
+            data_description += "Numerical Summaries:\n"
+            for col, stats in profile['numericalSummaries'].items():
+                data_description += format_column_summary(col, profile['dataTypes'][col], stats)
+        data_description += "\n"
+    
+    return data_description
+
+def format_shared_samples(profiles: list, budget: int) -> str:
+    """
+    Format the data samples of several datasets within a token budget.
+    Rows are allocated round-robin so every dataset gets a row before any
+    dataset gets more, and each schema's header is written only once with
+    a leading file column. Datasets that get no rows are listed in a notice.
+    """
+    schemas = group_by_schema(profiles)
+    headers = {}
+    for index, (columns, _) in enumerate(schemas, start=1):
+        headers[columns] = f"DATA SAMPLE: Schema {index} (TABULAR FORMAT):\nfile | {' | '.join(columns)}\n"
+    
+    # Reserve room for the omission notice in case every dataset is listed
+    candidates = [profile for profile in profiles if profile['sampleRows']]
+    notice_prefix = "Sample rows omitted to fit the context budget: "
+    budget -= estimate_tokens(notice_prefix + ", ".join(p['filename'] for p in candidates) + "\n")
+    
+    selected = {id(profile): [] for profile in profiles}
+    written_headers = set()
+    used = 0
+    active = candidates
+    for row_index in range(MAX_SAMPLE_ROWS):
+        still_active = []
+        for profile in active:
+            if row_index >= len(profile['sampleRows']):
+                continue
+            columns = tuple(profile['columnHeaders'])
+            line = f"{profile['filename']} | {profile['sampleRows'][row_index]}\n"
+            cost = estimate_tokens(line)
+            if columns not in written_headers:
+                cost += estimate_tokens(headers[columns])
+            if used + cost > budget:
+                continue
+            used += cost
+            written_headers.add(columns)
+            selected[id(profile)].append(line)
+            still_active.append(profile)
+        active = still_active
+        if not active:
+            break
+    
+    dataset_content = ""
+    for columns, schema_profiles in schemas:
+        if columns not in written_headers:
+            continue
+        dataset_content += headers[columns]
+        for profile in schema_profiles:
+            dataset_content += "".join(selected[id(profile)])
+        dataset_content += "\n"
+    
+    omitted = [profile['filename'] for profile in candidates if not selected[id(profile)]]
+    if omitted:
+        logger.info(f"Context budget used up, no sample rows for: {', '.join(omitted)}")
+        dataset_content += notice_prefix + ", ".join(omitted) + "\n"
+    return dataset_content
+
+def build_analysis_context(profiles: list) -> tuple:
+    """
+    Merge dataset profiles into a single token-budgeted context.
+    Returns a (data_description, dataset_content) tuple. Datasets with the
+    same columns share one schema description and one sample header. Sample
+    rows are only added while the budget allows, and per-file numerical
+    summaries are dropped if the descriptions alone exceed it.
+    """
+    if len(profiles) == 1:
+        profile = profiles[0]
+        data_description = f"File: {profile['filename']}\n"
+        data_description += f"Columns: {', '.join(profile['columnHeaders'])}\n"
+        data_description += f"Number of rows: {profile['rowCount']}\n\n"
+        
+        # Add data type information to the data description
+        data_description += "Column Data Types:\n"
+        for col, dtype in profile['dataTypes'].items():
+            data_description += format_column_summary(col, dtype, profile['numericalSummaries'].get(col))
+        
+        remaining = MAX_CONTEXT_TOKENS - estimate_tokens(data_description)
+        dataset_content = ""
+        if profile['sampleRows'] and remaining > 0:
+            dataset_content = format_sample_block("DATA SAMPLE (TABULAR FORMAT):", profile, remaining)
+        return data_description, dataset_content
+    
+    data_description = describe_datasets(profiles)
+    if estimate_tokens(data_description) > MAX_CONTEXT_TOKENS:
+        logger.info("Dataset descriptions exceed the context budget, dropping numerical summaries")
+        data_description = describe_datasets(profiles, include_summaries=False)
+    
+    remaining = MAX_CONTEXT_TOKENS - estimate_tokens(data_description)
+    dataset_content = format_shared_samples(profiles, remaining) if remaining > 0 else ""
+    return data_description, dataset_content
+
+def resolve_datasets(file_ids: list) -> tuple:
+    """
+    Look up uploaded datasets by ID.
+    Returns a (datasets, missing_ids) tuple where datasets is a list of
+    (file_id, dataset_info) pairs in request order.
+    """
+    if not hasattr(app, 'session_datasets'):
+        app.session_datasets = {}
+    
+    datasets = []
+    missing_ids = []
+    for file_id in file_ids:
+        if file_id in app.session_datasets:
+            datasets.append((file_id, app.session_datasets[file_id]))
+        else:
+            missing_ids.append(file_id)
+    return datasets, missing_ids
+
+def normalize_file_ids(data: dict) -> tuple:
+    """
+    Validate and combine the fileId and fileIds fields of a request.
+    Returns a (file_id, file_ids, error) tuple where file_ids starts with
+    file_id and has duplicate IDs removed, and error is a message for a
+    400 response or None if the fields are valid.
+    """
+    file_id = data.get('fileId')
+    file_ids = data.get('fileIds')
+    
+    if file_ids is not None and (not isinstance(file_ids, list) or not all(isinstance(f, str) for f in file_ids)):
+        logger.warning("Invalid fileIds provided")
+        return None, [], 'fileIds must be a list of file IDs'
+    
+    file_ids = ([file_id] if file_id else []) + (file_ids or [])
+    # Drop duplicate IDs while keeping the requested order
+    file_ids = list(dict.fromkeys(file_ids))
+    
+    if len(file_ids) > MAX_DATASETS_PER_REQUEST:
+        logger.warning(f"Too many datasets in request: {len(file_ids)}")
+        return None, [], f'Too many datasets. A request can analyze at most {MAX_DATASETS_PER_REQUEST} datasets.'
+    
+    return (file_ids[0] if file_ids else None), file_ids, None
+
+def load_analysis_context(file_ids: list) -> tuple:
+    """
+    Resolve the requested datasets and build the context sent to the AI.
+    Falls back to the last uploaded dataset when no file IDs are given.
+    Returns a (data_description, dataset_content, filename, missing_ids) tuple.
+    """
+    # Get the datasets based on the file IDs
+    if file_ids:
+        datasets, missing_ids = resolve_datasets(file_ids)
+        if missing_ids:
+            logger.warning(f"File IDs {missing_ids} not found in session datasets")
+            return None, None, None, missing_ids
+    elif hasattr(app, 'last_upload_data') and app.last_upload_data:
+        # Only fall back to last_upload_data if no specific file_id was provided
+        logger.info("No file_id provided. Using last uploaded data for analysis (fallback)")
+        datasets = [(app.last_upload_data.get('fileId'), app.last_upload_data)]
+    else:
+        logger.warning("No uploaded data found")
+        datasets = []
+    
+    if not datasets:
+        logger.warning("No dataset information available")
+        return None, None, None, []
+    
+    profiles = build_dataset_profiles(datasets)
+    data_description, dataset_content = build_analysis_context(profiles)
+    filename = ", ".join(profile['filename'] for profile in profiles)
+    return data_description, dataset_content, filename, []
+
+def has_valid_api_key() -> bool:
+    """Check if OpenAI API key exists and is not empty or malformed."""
+    api_key = os.getenv('OPENAI_API_KEY')
+    return bool(api_key and len(api_key) > 20 and not '\n' in api_key)
+
+def generate_analysis(prompt: str, data_description: str = None, dataset_content: str = None) -> str:
+    """Generate an analysis with OpenAI, falling back to a mock response if it is unavailable."""
+    if has_valid_api_key():
+        logger.info("Generating OpenAI response")
+        try:
+            return generate_openai_response(prompt, data_description, dataset_content)
+        except Exception as e:
+            logger.exception(f"Error calling OpenAI API: {str(e)}")
+            logger.info("Falling back to mock response due to API error")
+            return generate_mock_response(prompt)
+    else:
+        logger.warning("Invalid or missing OpenAI API key, using mock response")
+        return generate_mock_response(prompt)
+
+def add_history_items(history_items: list):
+    """Append history items to the in-memory history in a single atomic step."""
+    with history_lock:
+        if not hasattr(app, 'history_items'):
+            app.history_items = []
+        app.history_items.extend(history_items)
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_data():
     """
@@ -310,6 +856,7 @@ def analyze_data():
     Expects a JSON payload with:
     - prompt: The user's prompt
     - fileId: Optional file ID to associate with this analysis
+    - fileIds: Optional list of file IDs to analyze together in a single request
     Returns a JSON response with the analysis result.
     """
     logger.info("Analyze endpoint called")
@@ -323,164 +870,24 @@ def analyze_data():
         }), 400
     
     prompt = data['prompt']
-    file_id = data.get('fileId')
+    file_id, file_ids, error = normalize_file_ids(data)
+    if error:
+        return jsonify({
+            'error': error
+        }), 400
     
     logger.info(f"Received prompt: {prompt}")
-    logger.info(f"File ID: {file_id}")
+    logger.info(f"File IDs: {file_ids}")
     
-    # Get the dataset description based on the file ID
-    if file_id and hasattr(app, 'session_datasets') and file_id in app.session_datasets:
-        logger.info(f"Using data for file_id: {file_id}")
-        dataset_info = app.session_datasets[file_id]
-    elif not file_id and hasattr(app, 'last_upload_data') and app.last_upload_data:
-        # Only fall back to last_upload_data if no specific file_id was provided
-        logger.info("No file_id provided. Using last uploaded data for analysis (fallback)")
-        dataset_info = app.last_upload_data
-    else:
-        if file_id:
-            logger.warning(f"File ID {file_id} not found in session datasets")
-            return jsonify({
-                'error': f'Dataset with ID {file_id} not found'
-            }), 404
-        else:
-            logger.warning("No uploaded data found")
-            dataset_info = None
-    
-    # Create a data description for the AI
-    if dataset_info:
-        # Get column headers and a sample of the data
-        column_headers = dataset_info.get('columnHeaders', [])
-        parsed_data = dataset_info.get('parsedData', [])
-        filename = dataset_info.get('filename', 'unknown file')
-        
-        # Log the dataset being used for analysis
-        logger.info(f"Analyzing data from file: {filename}, File ID: {file_id}, Rows: {len(parsed_data)}, Columns: {len(column_headers)}")
-        
-        # Create a more comprehensive data description
-        data_description = f"File: {filename}\n"
-        data_description += f"Columns: {', '.join(column_headers)}\n"
-        data_description += f"Number of rows: {len(parsed_data)}\n\n"
-        
-        # Create dataset content with more rows (up to 20) for better context
-        dataset_content = ""
-        sample_rows = min(20, len(parsed_data))
-        
-        # Create a summary of data types and basic statistics for numerical columns
-        data_types = {}
-        numerical_summaries = {}
-        
-        # Detect data types and calculate basic statistics for numerical columns
-        if sample_rows > 0:
-            for col in column_headers:
-                # Collect non-null values for this column
-                col_values = []
-                for i in range(min(100, len(parsed_data))):  # Check up to 100 rows for type detection
-                    if i < len(parsed_data) and col in parsed_data[i] and parsed_data[i][col] is not None:
-                        col_values.append(parsed_data[i][col])
-                
-                if not col_values:
-                    data_types[col] = "unknown"
-                    continue
-                    
-                # Detect type based on first non-null value
-                first_val = col_values[0]
-                if isinstance(first_val, int):
-                    data_types[col] = "integer"
-                    # Calculate basic statistics for integers
-                    valid_nums = [v for v in col_values if isinstance(v, (int, float)) and not pd.isna(v)]
-                    if valid_nums:
-                        try:
-                            numerical_summaries[col] = {
-                                "min": min(valid_nums),
-                                "max": max(valid_nums),
-                                "avg": sum(valid_nums) / len(valid_nums),
-                                "count": len(valid_nums)
-                            }
-                        except Exception as e:
-                            logger.warning(f"Error calculating statistics for column {col}: {str(e)}")
-                elif isinstance(first_val, float):
-                    data_types[col] = "float"
-                    # Calculate basic statistics for floats
-                    valid_nums = [v for v in col_values if isinstance(v, (int, float)) and not pd.isna(v)]
-                    if valid_nums:
-                        try:
-                            numerical_summaries[col] = {
-                                "min": min(valid_nums),
-                                "max": max(valid_nums),
-                                "avg": sum(valid_nums) / len(valid_nums),
-                                "count": len(valid_nums)
-                            }
-                        except Exception as e:
-                            logger.warning(f"Error calculating statistics for column {col}: {str(e)}")
-                else:
-                    data_types[col] = "string/categorical"
-        
-        # Add data type information to the data description
-        data_description += "Column Data Types:\n"
-        for col, dtype in data_types.items():
-            data_description += f"- {col}: {dtype}"
-            if col in numerical_summaries:
-                stats = numerical_summaries[col]
-                data_description += f" (min: {stats['min']}, max: {stats['max']}, avg: {stats['avg']:.2f}, count: {stats['count']})"
-            data_description += "\n"
-        
-        # Format dataset content in a structured, tabular format
-        if sample_rows > 0:
-            # Create a header with column names
-            dataset_content += "DATA SAMPLE (TABULAR FORMAT):\n"
-            
-            # Format a header row
-            header_row = " | ".join(column_headers)
-            dataset_content += header_row + "\n"
-            dataset_content += "-" * len(header_row) + "\n"
-            
-            # Format data rows with proper value representation
-            for i in range(sample_rows):
-                if i >= len(parsed_data):
-                    break
-                    
-                row_values = []
-                for col in column_headers:
-                    if col in parsed_data[i]:
-                        value = parsed_data[i][col]
-                        # Format different value types appropriately
-                        if value is None:
-                            value_str = ""
-                        elif isinstance(value, (int, float)):
-                            # Format numbers consistently
-                            if isinstance(value, int):
-                                value_str = str(value)
-                            else:
-                                value_str = f"{value:.4f}".rstrip('0').rstrip('.') if '.' in f"{value:.4f}" else str(value)
-                        else:
-                            # For strings, ensure proper representation
-                            value_str = str(value)
-                            # Truncate very long strings
-                            if len(value_str) > 50:
-                                value_str = value_str[:47] + "..."
-                        row_values.append(value_str)
-                    else:
-                        row_values.append("")
-                dataset_content += " | ".join(row_values) + "\n"
-    else:
-        logger.warning("No dataset information available")
-        data_description = None
-        dataset_content = None
+    # Build the dataset context for the AI
+    data_description, dataset_content, filename, missing_ids = load_analysis_context(file_ids)
+    if missing_ids:
+        return jsonify({
+            'error': f"Dataset with ID {', '.join(missing_ids)} not found"
+        }), 404
     
     try:
-        # Check if OpenAI API key exists and is not empty or malformed
-        api_key = os.getenv('OPENAI_API_KEY')
-        if api_key and len(api_key) > 20 and not '\n' in api_key:
-            logger.info("Generating OpenAI response")
-            try:
-                result = generate_openai_response(prompt, data_description, dataset_content)
-            except Exception as e:
-                logger.exception(f"Error calling OpenAI API: {str(e)}")
-                logger.info("Falling back to mock response due to API error")
-                result = generate_mock_response(prompt)
-        else:
-            logger.warning("Invalid or missing OpenAI API key, using mock response")
-            result = generate_mock_response(prompt)
+        result = generate_analysis(prompt, data_description, dataset_content)
         
         # Generate a unique ID for this result
         result_id = f"result_{datetime.now().strftime('%Y%m%d%H%M%S')}_{abs(hash(prompt)) % 10000}"
@@ -492,14 +899,12 @@ def analyze_data():
             'answer': result,
             'timestamp': datetime.now(),
             'fileId': file_id,
-            'fileName': filename if file_id and dataset_info else "No file"
+            'fileIds': file_ids,
+            'fileName': filename if file_ids else "No file"
         }
         
         # Store in history
-        if not hasattr(app, 'history_items'):
-            app.history_items = []
-        
-        app.history_items.append(history_item)
+        add_history_items([history_item])
         logger.info(f"Added history item with ID: {result_id}")
         
         # Return the result
@@ -508,7 +913,8 @@ def analyze_data():
             'prompt': prompt,
             'timestamp': datetime.now().isoformat(),
             'id': result_id,
-            'fileId': file_id
+            'fileId': file_id,
+            'fileIds': file_ids
         })
         
     except Exception as e:
@@ -517,6 +923,143 @@ def analyze_data():
             'error': f'Failed to generate response: {str(e)}'
         }), 500
 
+# Batch analysis configuration
+MAX_BATCH_PROMPTS = 50          # Maximum number of prompts accepted in one batch request
+BATCH_MAX_CONCURRENCY = 4       # Upstream calls running at the same time
+BATCH_REQUESTS_PER_SECOND = 3   # Upstream calls started per second
+
+class RateLimiter:
+    """Thread-safe limiter that spaces out calls to at most `rate` per second."""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+    
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+batch_rate_limiter = RateLimiter(BATCH_REQUESTS_PER_SECOND)
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Endpoint to analyze data with many prompts at once.
+    Expects a JSON payload with:
+    - prompts: List of prompts to answer
+    - fileId: Optional file ID to associate with this analysis
+    - fileIds: Optional list of file IDs to analyze together
+    The dataset context is built once and shared by every prompt, and the
+    upstream calls run concurrently under a rate limit.
+    Returns a JSON response with one result or error per prompt, in order.
+    """
+    logger.info("Batch analyze endpoint called")
+    
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('prompts'), list) or not data['prompts']:
+        logger.warning("No prompts provided")
+        return jsonify({
+            'error': 'No prompts provided'
+        }), 400
+    
+    prompts = data['prompts']
+    if len(prompts) > MAX_BATCH_PROMPTS:
+        logger.warning(f"Too many prompts in batch: {len(prompts)}")
+        return jsonify({
+            'error': f'Too many prompts. A batch can contain at most {MAX_BATCH_PROMPTS} prompts.'
+        }), 400
+    
+    file_id, file_ids, error = normalize_file_ids(data)
+    if error:
+        return jsonify({
+            'error': error
+        }), 400
+    
+    logger.info(f"Received {len(prompts)} prompts")
+    logger.info(f"File IDs: {file_ids}")
+    
+    # Build the dataset context once for the whole batch
+    data_description, dataset_content, filename, missing_ids = load_analysis_context(file_ids)
+    if missing_ids:
+        return jsonify({
+            'error': f"Dataset with ID {', '.join(missing_ids)} not found"
+        }), 404
+    
+    use_openai = has_valid_api_key()
+    if not use_openai:
+        logger.warning("Invalid or missing OpenAI API key, using mock responses for batch")
+    
+    def analyze_prompt(prompt):
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise ValueError('Prompt must be a non-empty string')
+        if not use_openai:
+            return generate_mock_response(prompt)
+        # Upstream failures are raised so they become this item's error
+        batch_rate_limiter.wait()
+        return generate_openai_response(prompt, data_description, dataset_content, raise_errors=True)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_CONCURRENCY, len(prompts))) as executor:
+            futures = [executor.submit(analyze_prompt, prompt) for prompt in prompts]
+        
+        timestamp = datetime.now()
+        results = []
+        history_items = []
+        for index, (prompt, future) in enumerate(zip(prompts, futures)):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"Error analyzing prompt {index} in batch: {str(e)}")
+                results.append({
+                    'index': index,
+                    'prompt': prompt,
+                    'error': str(e)
+                })
+                continue
+            
+            # Generate a unique ID for this result
+            result_id = f"result_{timestamp.strftime('%Y%m%d%H%M%S')}_{abs(hash(prompt)) % 10000}_{index}"
+            
+            history_items.append({
+                'id': result_id,
+                'prompt': prompt,
+                'answer': result,
+                'timestamp': timestamp,
+                'fileId': file_id,
+                'fileIds': file_ids,
+                'fileName': filename if file_ids else "No file"
+            })
+            results.append({
+                'index': index,
+                'id': result_id,
+                'prompt': prompt,
+                'result': result
+            })
+        
+        # Store all history items in a single step
+        add_history_items(history_items)
+        logger.info(f"Added {len(history_items)} history items from batch of {len(prompts)} prompts")
+        
+        return jsonify({
+            'results': results,
+            'timestamp': timestamp.isoformat(),
+            'fileId': file_id,
+            'fileIds': file_ids
+        })
+        
+    except Exception as e:
+        logger.exception("Error generating batch responses")
+        return jsonify({
+            'error': f'Failed to generate responses: {str(e)}'
+        }), 500
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """
@@ -587,7 +1130,10 @@ def get_file_history(file_id):
         if not hasattr(app, 'history_items'):
             app.history_items = []
             
-        file_history = [item for item in app.history_items if item.get('fileId') == file_id]
+        file_history = [
+            item for item in app.history_items
+            if item.get('fileId') == file_id or file_id in item.get('fileIds', [])
+        ]
         
         return jsonify({
             'history': file_history
@@ -597,4 +1143,20 @@ def get_file_history(file_id):
         logger.exception(f"Error retrieving history for file {file_id}")
         return jsonify({
             'error': f'Failed to retrieve history: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@app.route('/api/memory/<file_id>', methods=['GET'])
+def get_memory_report(file_id):
+    """
+    Endpoint to retrieve the memory report for a specific file.
+    Returns the dtype and memory usage of each column before and after
+    dtype optimization at upload time.
+    """
+    if not hasattr(app, 'memory_reports') or file_id not in app.memory_reports:
+        logger.warning(f"No memory report found for file ID {file_id}")
+        return jsonify({
+            'error': f'Memory report for dataset with ID {file_id} not found'
+        }), 404
+    
+    return jsonify(app.memory_reports[file_id])
+
@@ -61,12 +61,14 @@ api.interceptors.response.use(
 export interface AnalyzeRequest {
   prompt: string;
   fileId?: string;
+  fileIds?: string[];
 }
 
 export interface AnalyzeResponse {
   result: string;
   prompt: string;
   fileId?: string;
+  fileIds?: string[];
   timestamp: string;
   id: string;
 }